@@ -15,15 +15,11 @@ def get_csiq_info(file_path: str) -> list:
     :param file_path: the path to the video dataset metadata file
     :return: list of video names, and their DMOS
     '''
-    with open(file_path, 'r') as f:
-        videos ,dmos = [], []
-        # Skip the 1st line of the file which includes titles
-        for i, line in enumerate(f):
-            if i == 0:
-                continue
-            videos.append(line.split()[0])
-            dmos.append(float(line.split()[1]))
-    dmos = np.array(dmos)
+    # Skip the 1st line of the file which includes titles, and parse the name and DMOS columns
+    df = pd.read_csv(file_path, sep=r'\s+', header=None, skiprows=1, usecols=[0, 1],
+                     dtype={0: str})
+    videos = df[0].tolist()
+    dmos = df[1].to_numpy(dtype=float)
     return videos, dmos
 
 def get_live_info(video_file: str, dmos_file: str) -> list:
@@ -35,13 +31,10 @@ def get_live_info(video_file: str, dmos_file: str) -> list:
     :return: list of video names, and their DMOS
     '''
     
-    with open(video_file, 'r') as vid_file, open(dmos_file, 'r') as dmos_file:
-        # Get the name of video sequences
-        videos = vid_file.read().strip().split('\n')
-        # Get the DMOS of each video
-        scores = dmos_file.read().strip().split('\n')
-        dmos = [float(score.split('\t')[0]) for score in scores]
-        dmos = np.array(dmos)
+    # Get the name of video sequences
+    videos = Path(video_file).read_text().strip().splitlines()
+    # Get the DMOS of each video, which is the first column of the tab separated file
+    dmos = pd.read_csv(dmos_file, sep='\t', header=None, usecols=[0])[0].to_numpy(dtype=float)
     
     return videos, dmos   
 
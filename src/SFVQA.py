@@ -9,6 +9,9 @@ from torchvision.models.feature_extraction import create_feature_extractor
 
 import DatasetHandler as dh
 
+# Precision of the feature extractor forward pass on GPU (it runs in float32 on CPU)
+AMP_DTYPE = torch.float16
+
 def set_feats_extractor(device, model_name='efficientnet', frame_layers={'avgpool':'avgpool'}, 
                         diff_layers={'avgpool':'avgpool'}, fine_tune=False, **kwargs):
     '''Set the model to extract both the content and style features according to the
@@ -70,6 +73,8 @@ def set_feats_extractor(device, model_name='efficientnet', frame_layers={'avgpoo
         model.eval()
         model.to(device)
 
+    # Put the model in inference mode, also after fine tuning
+    model.eval()
     # freeze all VGG parameters since we're only optimizing the target image
     for param in model.parameters():
         param.requires_grad_(False)
@@ -80,39 +85,159 @@ def set_feats_extractor(device, model_name='efficientnet', frame_layers={'avgpoo
     return ffeats_extractor, dfeats_extractor
 
 
-def gram_matrix(tensor, flat=True):
-    """ Calculate the Gram Matrix of a given tensor 
+def gram_batch(tensor, flat=True):
+    """ Calculate the Gram Matrices of a batch of feature maps in a single batched matmul
         Gram Matrix: https://en.wikipedia.org/wiki/Gramian_matrix
         
-        :param tensor: input tensor
-        :param flat: flatten the rsultant matrix if'True',
-        :return: Gram Matrix
+        :param tensor: input tensor of the shape (batch_size, depth, height, width)
+        :param flat: flatten the rsultant matrices if'True',
+        :return: Gram Matrices of the shape (batch_size, depth, depth), or their flattened
+                 upper-triangles of the shape (batch_size, depth * (depth + 1) / 2) if flat is True
     """
     
     # get the batch_size, depth, height, and width of the Tensor
     b, d, h, w = tensor.size()
     
-    # reshape so we're multiplying the features for each channel
-    tensor = tensor.view(b * d, h * w)
+    # reshape so we're multiplying the features for each channel of each frame,
+    # keep it contiguous so that bmm can pass it to gemm without a copy
+    tensor = tensor.reshape(b, d, h * w).contiguous()
     
-    # calculate the gram matrix
-    gram = torch.mm(tensor, tensor.t())
+    # calculate the gram matrices of all frames in the batch at once
+    gram = torch.bmm(tensor, tensor.transpose(1, 2))
 
     if flat == True:
-        # return torch.flatten(gram)
-        gram = gram.cpu().numpy()
-        # Get the upper-triangle of the gram matrix due to its symmetry
-        indices = np.triu_indices(gram.shape[0])
-        return gram[indices]
+        # Get the upper-triangle of each gram matrix due to its symmetry
+        rows, cols = torch.triu_indices(d, d, device=gram.device)
+        return gram[:, rows, cols]
     else:
         return gram
 
-def get_video_style_features(video, model, device, transform, hist_feat=False, bins=10):
+
+def features_to_style(features):
+    '''Turn the feature maps of a batch of frames into their concatenated style and content features
+    
+    :param features: a dict of feature maps of the specified layers, of the shape (batch_size, depth, height, width)
+    :return: a float32 tensor of the shape (batch_size, features) of concatenated features for each frame
+    '''
+    
+    batch_features = []
+    # Get flattened gram matrices of the frames and concatenate them as the new frames features
+    for layer, feature_maps in features.items():
+        # Sums of the Gram matrices may overflow float16, so they are computed in float32
+        feature_maps = feature_maps.float()
+        # If the layer is used for getting style features
+        if layer != 'avgpool':
+            batch_features.append(gram_batch(feature_maps))
+        else: # If the layer is used for getting content (CNN) features 
+            batch_features.append(feature_maps.flatten(start_dim=1))
+    
+    return torch.cat(batch_features, dim=1)
+
+# Fuse the Gram matrices, flattening and concatenation of the layers into compiled kernels on GPU
+# (torch.compile is available from PyTorch 2.0). It is used for the full batches, which have a fixed
+# shape and are captured in a CUDA graph
+if hasattr(torch, 'compile') and torch.cuda.is_available():
+    style_head = torch.compile(features_to_style, dynamic=False)
+else:
+    style_head = features_to_style
+
+
+def extract_style_features(frames, model, head=style_head):
+    '''Get the concatenated style and content features of a batch of preprocessed frames which are
+       already on the model device
+    
+    :param frames: a tensor of preprocessed frames of the shape (batch_size, 3, height, width)
+    :param model: feature extractor model
+    :param head: function turning the feature maps into the concatenated features
+    :return: a float32 tensor of the shape (batch_size, features) of concatenated features for each frame
+    '''
+    
+    # Get features maps of all frames from the specified layers, in half precision on GPU
+    with torch.autocast('cuda', dtype=AMP_DTYPE, enabled=frames.is_cuda):
+        features = model(frames)
+    
+    return head(features)
+
+
+# Captured CUDA graphs of the feature extractors, for each model and batch shape
+_cuda_graphs = {}
+
+def get_cuda_graph(model, frames):
+    '''Capture the feature extraction of a batch of frames of a fixed shape as a CUDA graph, so that
+       replaying it launches all the kernels at once. The graph is captured once for each model and
+       batch shape, and cached
+    
+    :param model: feature extractor model
+    :param frames: a batch of preprocessed frames, used to warm up the model
+    :return: the CUDA graph, its static input and static output tensors
+    '''
+    
+    key = (id(model), tuple(frames.shape))
+    if key not in _cuda_graphs:
+        static_input = frames.to('cuda', copy=True)
+        
+        # Warm up (e.g. cuDNN benchmarking) on a side stream before capturing, as CUDA graphs require
+        stream = torch.cuda.Stream()
+        stream.wait_stream(torch.cuda.current_stream())
+        with torch.cuda.stream(stream):
+            for _ in range(3):
+                extract_style_features(static_input, model, style_head)
+        torch.cuda.current_stream().wait_stream(stream)
+        
+        graph = torch.cuda.CUDAGraph()
+        with torch.cuda.graph(graph):
+            static_output = extract_style_features(static_input, model, style_head)
+        _cuda_graphs[key] = (graph, static_input, static_output)
+    
+    return _cuda_graphs[key]
+
+
+@torch.inference_mode()
+def get_batch_style_features(frames, model, device, cuda_graph=False, batch_size=32):
+    '''Get the style (Gram matrices) and content features of a batch of preprocessed frames
+    
+    :param frames: a tensor of preprocessed frames of the shape (batch_size, 3, height, width),
+                   which is in pinned memory if device is cuda
+    :param model: feature extractor model
+    :param device: 'torch.cuda' or 'torch.cpu'
+    :param cuda_graph: replay a captured CUDA graph of the feature extraction if device is cuda
+    :param batch_size: size of the full batches, which the compiled head is specialized on
+    :return: a float32 tensor of the shape (batch_size, features) of concatenated features for each frame,
+             which is kept on device (no autograd graph is recorded for it), and a CUDA event recorded right
+             after frames are copied to the device (None if device is cpu)
+    '''
+    
+    use_cuda = torch.device(device).type == 'cuda'
+    copy_done = torch.cuda.Event() if use_cuda else None
+    
+    if cuda_graph and use_cuda:
+        graph, static_input, static_output = get_cuda_graph(model, frames)
+        static_input.copy_(frames, non_blocking=True)
+        copy_done.record()
+        graph.replay()
+        # The static output is overwritten by the next replay
+        return static_output.clone(), copy_done
+    
+    # Copy the frames asynchronously, the copy from pinned memory overlaps the queued kernels
+    frames = frames.to(device, non_blocking=True)
+    if use_cuda:
+        copy_done.record()
+    
+    # Only full batches use the compiled head, the last batch of each video has a varying size
+    # which would trigger recompilations
+    head = style_head if frames.shape[0] == batch_size else features_to_style
+    
+    return extract_style_features(frames, model, head), copy_done
+
+
+def get_video_style_features(video, model, device, transform, hist_feat=False, bins=10, batch_size=32,
+                             cuda_graph=True):
     '''For a given array of video frames, preprocess each frame, get its specified layers' feature maps,
        turn the feature maps of each layer into gram matrices which indicates the correlation between features
        in individual layers, i.e. how similar the features in a single layer are. Similarities will include
        the general colors, textures and curvatures found in that layer, according to the style transfer paper
        by Gatys et al (2016). Finally, flatten and concatenate these matrices as the final style features of a frame.
+       Frames are fed to the model in batches to amortize the kernel launches.
        
     :param video: an array of video frames
     :param model: feature extractor model
@@ -120,45 +245,58 @@ def get_video_style_features(video, model, device, transform, hist_feat=False, b
     :param transform: torchvision preprocessing pipeline
     :param hist_feat: if True, get the histogram of the Gram matrices
     :param bins: number of bins for histogram
-    :return: an array of concatenated gram matrices for each frame in video
+    :param batch_size: number of frames going through the model at once
+    :param cuda_graph: replay a captured CUDA graph for the full batches if device is cuda
+    :return: an array of the shape (num of frames, features) of concatenated gram matrices for each frame in video
     '''
     
+    use_cuda = torch.device(device).type == 'cuda'
+    # Pinned host buffer of a batch of frames, allocated once the preprocessed frame size is known
+    host_buf = None
+    # Event recorded right after the last copy from host_buf (not after the computation of its batch),
+    # which has to finish before refilling it
+    copy_done = None
+    
     video_features = []
+    n = 0
     for frame in video:
         
         # Convert the array image to PIL image
         frame = Image.fromarray(frame)
         
         # Convert the image array to a tensor, and go through the defined preprocessing
-        # then add the batch dimension and transfer the tensor to the GPU (if available)
-        frame = transform(frame).unsqueeze(0).to(device)
+        frame = transform(frame)
+        
+        if host_buf is None:
+            host_buf = torch.empty((batch_size, *frame.shape), dtype=frame.dtype, pin_memory=use_cuda)
+        # Don't overwrite the buffer while the previous batch is still being copied from it
+        if n == 0 and copy_done is not None:
+            copy_done.synchronize()
+        host_buf[n].copy_(frame)
+        n += 1
         
-        # Get features maps of all frames from the specified layers
-        features = model(frame)
+        # Wait until the batch is full before feeding it to the model
+        if n < batch_size:
+            continue
         
-        frame_gram_matrices = []
-        # Get flattened gram matrix of each frame and concatenate them as the new frame features
-        for layer, feature_maps in features.items():
-            # If the layer is used for getting style features
-            if layer != 'avgpool':
-                frame_gram_matrices.extend(gram_matrix(feature_maps))
-            else: # If the layer is used for getting content (CNN) features 
-                frame_gram_matrices.extend(feature_maps.flatten().cpu().numpy())
+        batch_features, copy_done = get_batch_style_features(host_buf, model, device, cuda_graph, batch_size)
+        video_features.append(batch_features)
+        n = 0
+    
+    # Get the features of the remaining frames of the video, eagerly since their batch shape differs
+    if n:
+        video_features.append(get_batch_style_features(host_buf[:n], model, device, batch_size=batch_size)[0])
+    
+    if not video_features:
+        return np.empty((0, 0), dtype=np.float32)
+    
+    # Transfer the features of the whole video to the CPU at once
+    video_features = torch.cat(video_features).cpu().numpy()
        
-        # Add the new features of a the current frame to the video frame features
-        if hist_feat:
-            # Get the histogram of the Gram matrices of a frame as frame-level features
-            video_features.append(np.histogram(frame_gram_matrices, bins=bins)[0])
-        else:
-            # Get the Gram matrices of a frame as frame-level features
-            video_features.append(frame_gram_matrices)
-    
-    # # Check the shape of each layers's features for the last frame of the video
-    # for key, value in features.items():
-    #     print(f'Layer {key} features dimension = {value.shape}')
-    # # Check the shape of the resultant features of the last frame
-    # print(f'Concatenated Gram matrices dimension of a frame = {np.array(video_features[-1]).shape}')
-
+    if hist_feat:
+        # Get the histogram of the Gram matrices of each frame as frame-level features
+        video_features = np.array([np.histogram(frame_features, bins=bins)[0] for frame_features in video_features])
+    
     return video_features
 
 
@@ -1,22 +1,135 @@
+import queue
+import threading
+
 import skvideo.io
 import numpy as np
 
+try:
+    import av
+except ModuleNotFoundError:
+    av = None
+
+def av_frames(vid_path: str, vid_pix_fmt: str = "yuv420p", frame_color_mode: str = 'rgb',
+              height: int = 0, width: int = 0, stride: int = 1):
+    ''' Decode a video in-process using PyAV (FFmpeg bindings) with frame threading, instead of
+        piping the raw frames from an ffmpeg subprocess
+    
+    :param vid_path: path of a video to extract
+    :param vid_pix_fmt: pixel format of a YUV video (not used for mp4 videos)
+    :param frame_color_mode: extracted frames'pixel format ('rgb' or 'gray')
+    :param height: height of a YUV video frame (not used for mp4 videos)
+    :param width: width of a YUV video frame (not used for mp4 videos)
+    :param stride: keep only every stride-th frame
+    :return: a generator of video frames of the size (height * width * num of channels)
+    '''
+    
+    # Raw YUV videos have no header, so the demuxer needs their pixel format and frame size
+    if vid_path.split('.')[-1] == 'yuv':
+        container = av.open(vid_path, format='rawvideo',
+                            options={'pixel_format': vid_pix_fmt, 'video_size': f'{width}x{height}'})
+    else:
+        container = av.open(vid_path)
+    
+    out_format = 'rgb24' if frame_color_mode == 'rgb' else 'gray'
+    with container:
+        stream = container.streams.video[0]
+        # Let FFmpeg decode the frames using all the available cores
+        stream.thread_type = 'AUTO'
+        for i, frame in enumerate(container.decode(stream)):
+            # Skip the color conversion and copy of the frames which are not kept
+            if i % stride:
+                continue
+            frame = frame.to_ndarray(format=out_format)
+            # Keep the channel dimension of gray frames, the same as skvideo does
+            yield frame if frame.ndim == 3 else frame[..., np.newaxis]
+
+def prefetch_frames(frames_gen, prefetch: int = 64):
+    '''Decode the frames of a video in a background thread, so that decoding overlaps the feature
+       extraction of the frames which are already decoded
+    
+    :param frames_gen: a generator of video frames
+    :param prefetch: maximum number of decoded frames waiting to be consumed
+    :return: a generator of the same video frames
+    '''
+    
+    # The bounded queue blocks the decoder when the consumer falls behind
+    frames_q = queue.Queue(maxsize=prefetch)
+    end = object()
+    # Set when the consumer stops (finished, raised or closed early), to let the decoder exit
+    stop = threading.Event()
+    
+    def put(item):
+        # Wait for room in the queue, unless the consumer has stopped. Returns False if it has
+        while not stop.is_set():
+            try:
+                frames_q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+    
+    def decode():
+        try:
+            for frame in frames_gen:
+                if not put(frame):
+                    break
+            else:
+                put(end)
+        except Exception as e:
+            put(e)
+        finally:
+            # Release the decoder (e.g. the open PyAV container) of the video
+            if hasattr(frames_gen, 'close'):
+                frames_gen.close()
+    
+    threading.Thread(target=decode, daemon=True).start()
+    
+    try:
+        while (frame := frames_q.get()) is not end:
+            # Raise the decoding errors in the consumer thread
+            if isinstance(frame, Exception):
+                raise frame
+            yield frame
+    finally:
+        stop.set()
+
+def frames_diffs(frames_gen):
+    '''Stream the differences of consecutive frames of a video as temporal changes, without keeping
+       all the frames or differences of the video in memory
+    
+    :param frames_gen: a generator of video frames
+    :return: a generator of differences of consecutive frames, of the same dtype as the frames
+    '''
+    
+    frames_gen = iter(frames_gen)
+    last_frame = next(frames_gen, None)
+    for frame in frames_gen:
+        yield np.subtract(frame, last_frame)
+        last_frame = frame
+
 def get_frames(vid_path: str, vid_pix_fmt: str = "yuv420p", frame_color_mode: str = 'rgb', 
-                   height: int = 0, width: int = 0, *, frame_diff=False):
-    ''' Get an input path containing a video and return its frames
+                   height: int = 0, width: int = 0, *, frame_diff=False, stride: int = 1):
+    ''' Get an input path containing a video and return its frames. Frames are decoded by PyAV
+        if it is installed, otherwise by skvideo
     
     :param path_in: path of a video to extract
     :param vid_pix_fmt: pixel format of a YUV video (not used for mp4 videos)
     :param frame_color_mode: extracted frames'pixel format ('rgb' or 'gray') (not used for mp4 videos)
     :param height: height of a YUV video frame. Useful for raw inputs when video header does not exist.(not used for mp4      videos)
     :param width: width of a YUV video frame. Useful for raw inputs when video header does not exist. (not used for mp4        videos)
-    :return: a generator of video frames of the size (num of frames * height * width * num of channels)
+    :param frame_diff: return the differences of consecutive (kept) frames instead if True
+    :param stride: keep only every stride-th frame of the video
+    :return: a generator of video frames (or their differences) of the size (num of frames * height * width * num of channels)
     '''
     
     # Get the video extension
     extension = vid_path.split('.')[-1]
     # Check the video type to set the proper params
-    if extension == 'mp4':
+    if av is not None:
+        if extension == 'mp4':
+            frame_color_mode = 'rgb'
+        frames_gen = av_frames(vid_path, vid_pix_fmt, frame_color_mode, height, width, stride)
+    elif extension == 'mp4':
         frames_gen = skvideo.io.vreader(vid_path)
     # Otherwise check the output frame color mode for YUV videos
     elif frame_color_mode == 'rgb':
@@ -26,15 +139,12 @@ def get_frames(vid_path: str, vid_pix_fmt: str = "yuv420p", frame_color_mode: st
     else:
         frames_gen = None
     
+    # skvideo decodes all the frames, so only drop the ones which are not kept
+    if av is None and frames_gen is not None and stride > 1:
+        frames_gen = (frame for i, frame in enumerate(frames_gen) if i % stride == 0)
+    
     # Get consecutive frames diffs as temporal changes
     if frame_diff:
-        frames_diff = []
-        for i, frame in enumerate(frames_gen):
-            if i > 0:
-                diff = np.subtract(frame, last_frame)
-                frames_diff.append(diff)
-            last_frame = frame
-        return np.array(frames_diff)
+        return frames_diffs(frames_gen)
     else:
         return frames_gen
-        
\ No newline at end of file
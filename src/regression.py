@@ -1,11 +1,15 @@
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 import numpy as np
 import seaborn as sns
+from joblib import Parallel, cpu_count, delayed, effective_n_jobs, parallel_backend
 from scipy.stats.mstats import spearmanr
 from scipy.stats.mstats import pearsonr
+from sklearn.kernel_approximation import Nystroem
 from sklearn.model_selection import KFold
 from sklearn.model_selection import GroupShuffleSplit
+from sklearn.pipeline import make_pipeline
 from sklearn.preprocessing import StandardScaler
+from sklearn.svm import LinearSVR
 # from sklearn.svm import SVR
 from sklearnex.svm import SVR
 
@@ -16,50 +20,116 @@ try:
     from tensorflow.keras.models import Sequential
     from tensorflow.keras.layers import Dense, Dropout
     from tensorflow.keras.layers import BatchNormalization
+    from tensorflow.keras import mixed_precision
     from tensorflow.keras import optimizers
 
-    def nn_regressor(X_train, y_train):
-        '''Use a multi layer neural network as a regressor
+    def build_nn_regressor(input_size):
+        '''Build and compile a multi layer neural network regressor, so that it can be reused for all folds
 
-        :param X_train: input samples' features
-        :param y_train: target scores
-        :return: a trained regressor model and the training history
+        :param input_size: number of input samples' features
+        :return: the compiled model and its initial state, i.e. its initial weights and the initial values
+                 of its optimizer variables
         '''
-        input_size = X_train.shape[1]
+        # Use float16 compute with tensor cores and XLA fusion of the layers on GPU. The dtype policy is
+        # set per layer and XLA per model, not globally, so later models of the session are not affected
+        use_gpu = bool(tensorflow.config.list_physical_devices('GPU'))
+        dtype = 'mixed_float16' if use_gpu else None
 
         model = Sequential()
-        model.add(Dense(4096, kernel_initializer='normal', activation='relu', input_shape=(input_size,)))#layer 1
-        model.add(BatchNormalization())
-        model.add(Dense(2048, kernel_initializer='normal', activation='relu'))#layer 2
+        model.add(Dense(4096, kernel_initializer='normal', activation='relu', input_shape=(input_size,),
+                        dtype=dtype))#layer 1
+        model.add(BatchNormalization(dtype=dtype))
+        model.add(Dense(2048, kernel_initializer='normal', activation='relu', dtype=dtype))#layer 2
         # model.add(BatchNormalization())
-        model.add(Dropout(0.2))
-        model.add(Dense(1024, kernel_initializer='normal', activation='relu'))#layer 3
-        model.add(Dropout(0.2))
+        model.add(Dropout(0.2, dtype=dtype))
+        model.add(Dense(1024, kernel_initializer='normal', activation='relu', dtype=dtype))#layer 3
+        model.add(Dropout(0.2, dtype=dtype))
+
+        model.add(Dense(512, kernel_initializer='normal', activation='relu', dtype=dtype))#layer 4
+        model.add(Dropout(0.2, dtype=dtype))
+
+        model.add(Dense(256, kernel_initializer='normal', activation='relu', dtype=dtype))#layer 5
+        model.add(Dropout(0.2, dtype=dtype))
+
+        model.add(Dense(128, kernel_initializer='normal', activation='relu', dtype=dtype))#layer 6
+        model.add(Dropout(0.2, dtype=dtype))
+
+        # Keep the output in float32 for a numerically stable loss under mixed precision
+        model.add(Dense(1, kernel_initializer='normal', activation='linear', dtype='float32'))#layer 7
+
+        optimizer = optimizers.Adam(learning_rate=4e-5)
+        if use_gpu:
+            # Scale the loss to keep the float16 gradients from underflowing
+            optimizer = mixed_precision.LossScaleOptimizer(optimizer)
+        model.compile(optimizer=optimizer, loss='mean_squared_error', metrics=['mean_squared_error'],
+                      jit_compile=use_gpu)
 
-        model.add(Dense(512, kernel_initializer='normal', activation='relu'))#layer 4
-        model.add(Dropout(0.2))
+        # Create the optimizer variables now (they are created lazily by the first fit otherwise),
+        # so that their initial values (learning rate, iterations, moments) can be restored per fold
+        optimizer = model.optimizer
+        if hasattr(optimizer, 'build'):
+            optimizer.build(model.trainable_variables)
+        else:
+            getattr(optimizer, 'inner_optimizer', optimizer)._create_all_weights(model.trainable_variables)
+        initial_opt_values = [var.numpy() for var in optimizer_variables(optimizer)]
 
-        model.add(Dense(256, kernel_initializer='normal', activation='relu'))#layer 5
-        model.add(Dropout(0.2))
+        return model, (model.get_weights(), initial_opt_values)
 
-        model.add(Dense(128, kernel_initializer='normal', activation='relu'))#layer 6
-        model.add(Dropout(0.2))
+    def optimizer_variables(optimizer):
+        '''Get the variables of a Keras optimizer, which are a method in the legacy optimizers and a
+           property in the newer ones
+        '''
+        opt_vars = optimizer.variables
+        return opt_vars() if callable(opt_vars) else opt_vars
 
-        model.add(Dense(1, kernel_initializer='normal', activation='linear'))#layer 7
+    def nn_regressor(X_train, y_train, model=None, initial_state=None, batch_size=8):
+        '''Use a multi layer neural network as a regressor
+
+        :param X_train: input samples' features
+        :param y_train: target scores
+        :param model: a compiled model from build_nn_regressor to be reused, a new one is built if None
+        :param initial_state: initial state of the given model from build_nn_regressor, which it is reset
+                              to before training
+        :param batch_size: number of samples per gradient update
+        :return: a trained regressor model and the training history
+        '''
+        if model is None:
+            model, initial_state = build_nn_regressor(X_train.shape[1])
+        else:
+            # Reset the weights and the optimizer state, instead of building and compiling a new model
+            initial_weights, initial_opt_values = initial_state
+            model.set_weights(initial_weights)
+            for var, value in zip(optimizer_variables(model.optimizer), initial_opt_values):
+                var.assign(value)
 
         callback=tensorflow.keras.callbacks.EarlyStopping(monitor='val_loss',min_delta=0,patience=5,
                                                           verbose=1,mode="min",baseline=None,
                                                           restore_best_weights=True)
-        model.compile(optimizer= optimizers.Adam(learning_rate=4e-5),loss='mean_squared_error',
-                      metrics=['mean_squared_error'])
 
-        history = model.fit(X_train, y_train, epochs=50, batch_size=8, validation_split=0.1,
+        history = model.fit(X_train, y_train, epochs=50, batch_size=batch_size, validation_split=0.1,
                             verbose=0, callbacks=[callback])
 
         return model, history
 except ModuleNotFoundError:
     pass
     
+def nystroem_regressor(X_train, y_train, n_components=100):
+    '''Use a linear SVR on a Nystroem approximation of the RBF kernel as a regressor, which
+       avoids computing the full kernel matrix of the training samples
+
+    :param X_train: input samples' features (standardized)
+    :param y_train: target scores
+    :param n_components: number of samples used to approximate the kernel feature map
+    :return: a trained regressor model
+    '''
+    # gamma is set the same as the 'scale' gamma of SVR for standardized features
+    regressor = make_pipeline(Nystroem(kernel='rbf', gamma=1.0 / X_train.shape[1],
+                                       n_components=min(n_components, len(X_train))),
+                              LinearSVR(epsilon=0.3, max_iter=10000))
+    regressor.fit(X_train, y_train)
+
+    return regressor
+
 def normalize_cross_scores(cross_dataset, yc):
     '''Normalize the cross dataset scores to be in the range [0, 1]
     '''
@@ -71,41 +141,37 @@ def normalize_cross_scores(cross_dataset, yc):
         return ((yc - 1) / 4.0)
 
     
-def calc_correlation(y_gt, y_pred, sc, dataset=None, delimiter='-'):
-    '''Calculate SROCC with p and PLCC
+def calc_correlation(y_gt, y_pred):
+    '''Calculate SROCC with p and PLCC. The predicted scores are used as they are, in the scale of
+       the train set scores' StandardScaler, since bringing them back to the MOS range (and normalizing
+       them to the cross dataset range) is a positive affine map, to which both correlations are invariant
     
     :param y_gt: Subjective MOSs of the validation or test set
-    :param y_pred: predicted scores of the validation or test set
-    :param sc: StandardScaler of the train set MOS
-    :param dataset: if given, predicted scores have to be normalized to compare with cross dataset MOS
+    :param y_pred: (scaled) predicted scores of the validation or test set
     :return: correlation between  MOSs and predicted scores
     '''
-    # Turn y_pred into a 2D array to match StandardScalar() input
-    y_pred = y_pred.reshape(-1, 1)
-    # Inverse transform the predicted values to get the real values
-    y_pred = sc.inverse_transform(y_pred)
-    
-    # If dataset name has been given, normalize the results to compare with the cross dataset scores
-    # since the ground-truth (y_gt) of the cross dataset has already been normalized
-    if dataset == 'konvid1k' or dataset == 'youtube_ugc':
-        y_pred -= 1
-        y_pred /= 4.0
-    elif dataset == 'live_vqc':
-        y_pred /= 100.0
-
     # Calculate the Spearman rank-order correlation
-    srocc, p = spearmanr(y_gt.squeeze(), y_pred.squeeze())
+    srocc, p = spearmanr(y_gt.ravel(), y_pred.ravel())
 
     # Calculate the Pearson correlation
-    plcc, _ = pearsonr(y_gt.squeeze(), y_pred.squeeze())
-    
-    text = f'Spearman correlation = {srocc:.4f} with p = {p:.4f},  Pearson correlation = {plcc:.4f}\n'
-    with open('correlation.txt', 'a') as writer:
-        writer.write(text)
-        writer.write(delimiter * 70 + '\n')
+    plcc, _ = pearsonr(y_gt.ravel(), y_pred.ravel())
     
     return srocc, p, plcc
 
+def correlation_record(num, srocc, p, plcc, delimiter='-'):
+    '''Format the correlations of a train/test split as a record of the correlation.txt file
+    
+    :param num: number of the split, the same as in its plot file names
+    :param delimiter: character of the line separating the records
+    :return: the record text
+    '''
+    text = f'{num}: Spearman correlation = {srocc:.4f} with p = {p:.4f},  Pearson correlation = {plcc:.4f}\n'
+    
+    return text + delimiter * 70 + '\n'
+
+# Figure and axes reused by plot_correlation for all the plots (of each process)
+_plot_fig, _plot_ax = None, None
+
 def plot_correlation(y_gt, y_pred, sc, num, srocc, dataset=None, cross_dataset=None):
     '''Plot SROCC of predicted and ground-truth scores
     
@@ -139,24 +205,223 @@ def plot_correlation(y_gt, y_pred, sc, num, srocc, dataset=None, cross_dataset=N
     else:
         file_path = f'plots/{num}_{abs(srocc):.4f}.png'
         
+    # Plot the correlation between ground-truth and predicted scores, reusing the figure of the
+    # previous folds instead of allocating a new one for each plot
+    global _plot_fig, _plot_ax
+    if _plot_fig is None:
+        sns.set(style='darkgrid')
+        # Not created by pyplot, so it isn't kept open by pyplot or rendered inline in the notebook
+        _plot_fig = Figure(figsize=(8.4, 7))
+        _plot_ax = _plot_fig.add_subplot()
+    _plot_ax.cla()
+    sns.scatterplot(x=y_gt.squeeze(), y=y_pred.squeeze(), ax=_plot_ax)
+    _plot_ax.set(xlabel='Ground-truth MOS', ylabel='Predicted Score')
+    _plot_fig.savefig(file_path, bbox_inches='tight')
+
+def fold_scaler(stats, X_test, X_train):
+    '''Get a StandardScaler fitted on the train set of a fold, using the statistics of the whole
+       dataset and removing the contribution of the (smaller) test set from them, instead of
+       refitting on the train set of every fold
+    
+    :param stats: (mean, variance, number of samples) of the whole dataset, in float64
+    :param X_test: samples of the test set of the fold
+    :param X_train: samples of the train set of the fold, only used to recompute the statistics of the
+                    features whose derived variance is within the rounding error
+    :return: a StandardScaler equivalent to the one fitted on the train set
+    '''
+    mean_all, var_all, n_all = stats
+    n_train = n_all - len(X_test)
+    eps = np.finfo(np.float64).eps
+    
+    # Sums of the train set samples centered around the whole dataset mean, where the sums of all
+    # the centered samples are 0 and n_all * var_all
+    X_test = X_test - mean_all
+    sum_train = -X_test.sum(axis=0)
+    sq_sum_train = n_all * var_all - (X_test ** 2).sum(axis=0)
+    
+    shift = sum_train / n_train
+    mean = mean_all + shift
+    var = np.maximum(sq_sum_train / n_train - shift ** 2, 0)
+    
+    # A feature constant on the train set (e.g. a dead channel) only keeps the cancellation residue of
+    # the whole dataset magnitude as its derived variance, so recompute its exact train statistics
+    inexact = var <= n_all * eps * var_all + (n_all * mean_all * eps) ** 2
+    if inexact.any():
+        mean[inexact] = X_train[:, inexact].mean(axis=0, dtype=np.float64)
+        var[inexact] = X_train[:, inexact].var(axis=0, dtype=np.float64)
+    
+    sc = StandardScaler()
+    sc.mean_ = mean
+    sc.var_ = var
+    # Leave the constant features unscaled, using the same tolerance as StandardScaler
+    sc.scale_ = np.sqrt(var)
+    constant = var <= n_train * eps * var + (n_train * mean * eps) ** 2
+    sc.scale_[constant] = 1.0
+    sc.n_samples_seen_ = n_train
+    sc.n_features_in_ = X_test.shape[1]
+    
+    return sc
+
+def check_fold_scaler(n_all=150, n_test=30, n_features=20, seed=0):
+    '''Check that fold_scaler matches a StandardScaler refitted on the train set, including a feature
+       which is constant on the train set but not on the test set, and one of large magnitude like
+       the Gram matrix entries
+    '''
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n_all, n_features)).astype(np.float32)
+    X[:, 1] *= 1e5
+    test_idx = rng.choice(n_all, n_test, replace=False)
+    train_idx = np.setdiff1d(np.arange(n_all), test_idx)
+    # A dead channel on the train set
+    X[:, 0] = 0
+    X[test_idx[0], 0] = 142857
+    
+    stats = (X.mean(axis=0, dtype=np.float64), X.var(axis=0, dtype=np.float64), n_all)
+    sc = fold_scaler(stats, X[test_idx], X[train_idx])
+    sc_ref = StandardScaler().fit(X[train_idx])
+    
+    for idx in (train_idx, test_idx):
+        assert np.allclose(sc.transform(X[idx]), sc_ref.transform(X[idx]), rtol=1e-4, atol=1e-4)
+    print('fold_scaler matches the refitted StandardScaler')
+
+def fit_fold(X, y, train_idx, test_idx, num, Xc=None, yc=None, ycn=None, dataset=None,
+             cross_dataset=None, regression_method='svr', X_stats=None, y_stats=None, nn_model=None,
+             plot=True):
+    '''Train a regressor on a single train/test split of the features, predict the scores of the test
+       set (and cross dataset if given), then calculate the SROCC & PLCC
+       
+    :param X: an array of features of all images/videos in the dataset
+    :param y: a 2D array of scores of all images/videos in the dataset
+    :param train_idx: indices of the train set
+    :param test_idx: indices of the test set
+    :param num: number of the split, used to name its plots
+    :param ycn: normalized scores of the cross dataset
+    :param regression_method: 'svr' for SVR, 'nystroem' for linear SVR on approximated RBF kernel
+                              or 'nn' for multi layer neural network
+    :param X_stats: (mean, variance, number of samples) of X, to derive the train set scaler from
+    :param y_stats: (mean, variance, number of samples) of y, to derive the train set scaler from
+    :param nn_model: (compiled model, initial state) from build_nn_regressor, reused by the 'nn' regressor
+    :param plot: save the plots of the predicted and ground-truth scores if True
+    :return: srocc, p, plcc of the test set, srocc, plcc of the cross dataset (None if not given), and
+             the records of the correlations to be written to correlation.txt
+    '''
+    
+    # Split train validation set
+    X_train, y_train = X[train_idx], y[train_idx]
+    X_test, y_test = X[test_idx], y[test_idx]
+
+    # Feature scaling
+    if X_stats is not None:
+        sc_X = fold_scaler(X_stats, X_test, X_train)
+        sc_y = fold_scaler(y_stats, y_test, y_train)
+        X_train = sc_X.transform(X_train)
+        y_train = sc_y.transform(y_train)
+    else:
+        sc_X = StandardScaler()
+        sc_y = StandardScaler()
+        X_train = sc_X.fit_transform(X_train)
+        y_train = sc_y.fit_transform(y_train)
+    X_test = sc_X.transform(X_test)
+    
+    if regression_method.lower() == 'svr':
+        # Set the regressor to SVR
+        regressor = SVR(kernel='rbf', epsilon=0.3)
+        # Train the regresoor model
+        regressor.fit(X_train, y_train.squeeze())
+    elif regression_method.lower() == 'nystroem':
+        regressor = nystroem_regressor(X_train, y_train.squeeze())
+    elif regression_method.lower() == 'nn':
+        # Set the regressor to neural network
+        if nn_model is None:
+            tensorflow.keras.backend.clear_session()
+            regressor, history = nn_regressor(X_train, y_train.squeeze())
+        else:
+            regressor, history = nn_regressor(X_train, y_train.squeeze(), *nn_model)
+
+    # Predict the scores for X_test videos features
+    y_pred = regressor.predict(X_test)
+    
+    srocc, p, plcc = calc_correlation(y_test, y_pred)
+    record = correlation_record(num, srocc, p, plcc)
+    
     # Plot the correlation between ground-truth and predicted scores             
-    sns.set(style='darkgrid')
-    scatter_plot = sns.relplot(x=y_gt.squeeze(), y=y_pred.squeeze(),
-                               kind='scatter', height=7, aspect=1.2, palette='coolwarm').set(
-                               xlabel='Ground-truth MOS', ylabel='Predicted Score');
-     
-    plt.close()
-    scatter_plot.savefig(file_path)
+    if plot:
+        plot_correlation(y_test, y_pred, sc_y, num, srocc)
+
+    cross_srocc, cross_plcc = None, None
+    # if cross dataset validation is required
+    if Xc is not None:
+        Xcs = sc_X.transform(Xc)
+
+        yc_pred = regressor.predict(Xcs)
+
+        cross_srocc, cross_p, cross_plcc = calc_correlation(ycn, yc_pred)
+        record += correlation_record(num, cross_srocc, cross_p, cross_plcc, '*')
+
+        # Plot the correlation between ground-truth and predicted scores             
+        if plot:
+            plot_correlation(yc, yc_pred, sc_y, num, cross_srocc, dataset, cross_dataset)
+    
+    return srocc, p, plcc, cross_srocc, cross_plcc, record
+
+def cross_validate(X, y, splits, Xc=None, yc=None, dataset=None, cross_dataset=None,
+                   regression_method='svr', n_jobs=4, plot=True):
+    '''Run fit_fold for all the given train/test splits in parallel and gather the correlations
+
+    :param splits: an iterable of (train_idx, test_idx) pairs
+    :param n_jobs: number of parallel jobs (folds of the neural network regressor always run serially)
+    :param plot: save the plots of the predicted and ground-truth scores of each split if True
+    :return: SROCC_coef, SROCC_p, PLCC, CROSS_SROCC, CROSS_PLCC
+    '''
+
+    # if cross dataset validation is required
+    ycn = normalize_cross_scores(cross_dataset, yc) if Xc is not None else None
+    
+    # Keras models share the TF session, so they can't be trained in parallel. Build and compile
+    # the model once, and only reset its weights for each fold
+    nn_model = None
+    if regression_method.lower() == 'nn':
+        n_jobs = 1
+        tensorflow.keras.backend.clear_session()
+        nn_model = build_nn_regressor(X.shape[1])
+    
+    # Statistics of the whole dataset, computed once, from which the scalers of all folds are derived
+    X_stats = (X.mean(axis=0, dtype=np.float64), X.var(axis=0, dtype=np.float64), len(X))
+    y_stats = (y.mean(axis=0, dtype=np.float64), y.var(axis=0, dtype=np.float64), len(y))
+    
+    # Share the cores between the workers, so that the multithreaded regressors (e.g. sklearnex SVR)
+    # in each worker don't oversubscribe the CPU
+    inner_threads = max(1, cpu_count() // effective_n_jobs(n_jobs))
+    with parallel_backend('loky', inner_max_num_threads=inner_threads):
+        results = Parallel(n_jobs=n_jobs)(delayed(fit_fold)(X, y, train_idx, test_idx, num, Xc, yc, ycn, dataset,
+                                                            cross_dataset, regression_method, X_stats, y_stats,
+                                                            nn_model, plot)
+                                          for num, (train_idx, test_idx) in enumerate(splits, start=1))
+    
+    SROCC_coef, SROCC_p, PLCC, CROSS_SROCC, CROSS_PLCC, records = map(list, zip(*results))
+    
+    # Write the records from the parent process in the order of the splits, which the workers
+    # may finish in any order
+    with open('correlation.txt', 'a') as writer:
+        writer.write(''.join(records))
+    
+    if Xc is None:
+        CROSS_SROCC, CROSS_PLCC = None, None
+    
+    return SROCC_coef, SROCC_p, PLCC, CROSS_SROCC, CROSS_PLCC
 
 def synthetic_dataset_regression(X, y, dist_per_ref, Xc=None, yc=None, dataset='kadid0k',
-                                 cross_dataset=None, regression_method='svr'):
+                                 cross_dataset=None, regression_method='svr', n_jobs=4, plot=True):
     '''Train a regressor Using the image/video features and their corresponding scores from
        a synthetically distorted IQA/VQA dataset, predict the scores of test data. 
        Finally calculate the SROCC & PLCC.
        
     :param X: an array of features of all images/videos in the dataset
     :param y: an array scores of all images/videos in the dataset
-    :param regression_method: 'svr' for SVR or 'nn' for multi layer neural network
+    :param regression_method: 'svr' for SVR, 'nystroem' for linear SVR on approximated RBF kernel
+                              or 'nn' for multi layer neural network
+    :param n_jobs: number of train/test splits evaluated in parallel
+    :param plot: save the plots of the predicted and ground-truth scores of each split if True
     :return: SROCC_coef, SROCC_p, PLCC
     '''
             
@@ -173,157 +438,44 @@ def synthetic_dataset_regression(X, y, dist_per_ref, Xc=None, yc=None, dataset='
                
     gss = GroupShuffleSplit(n_splits=100, train_size=0.8)
     
-    SROCC_coef, SROCC_p, PLCC = [], [], []
-    
-    # if cross dataset validation is required
-    if Xc is not None:
-        CROSS_SROCC, CROSS_PLCC = [], []
-        ycn = normalize_cross_scores(cross_dataset, yc)
-    else:
-        CROSS_SROCC, CROSS_PLCC = None, None
-   
-    for train_idx, test_idx in gss.split(X, y, groups):
-        # Split train validation set
-        X_train, y_train = X[train_idx], y[train_idx]
-        X_test, y_test = X[test_idx], y[test_idx]
-
-        # Feature scaling
-        sc_X = StandardScaler()
-        sc_y = StandardScaler()
-        
-        X_train = sc_X.fit_transform(X_train)
-        X_test = sc_X.transform(X_test)
-        y_train = sc_y.fit_transform(y_train)
-        
-        if regression_method == 'svr':
-            # Set the regressor to SVR
-            regressor = SVR(kernel='rbf', epsilon=0.3)
-            # Train the regresoor model
-            regressor.fit(X_train, y_train.squeeze())
-        elif regression_method == 'nn':
-            # Set the regressor to neural network
-            tensorflow.keras.backend.clear_session()
-            regressor, history = nn_regressor(X_train, y_train.squeeze())
-
-        # Predict the scores for X_test videos features
-        y_pred = regressor.predict(X_test)
-        
-        srocc, p, plcc = calc_correlation(y_test, y_pred, sc_y)
-        
-        SROCC_coef.append(srocc)
-        SROCC_p.append(p)
-        PLCC.append(plcc)
-                            
-        pass
-        # Plot the correlation between ground-truth and predicted scores             
-        plot_correlation(y_test, y_pred, sc_y, len(SROCC_coef), srocc)
-
-        # if cross dataset validation is required
-        if Xc is not None:
-            Xcs = sc_X.transform(Xc)
+    return cross_validate(X, y, gss.split(X, y, groups), Xc, yc, dataset, cross_dataset,
+                          regression_method, n_jobs, plot)
 
-            yc_pred = regressor.predict(Xcs)
-
-            srocc, _, plcc = calc_correlation(ycn, yc_pred, sc_y, dataset, '*')
-            
-            CROSS_SROCC.append(srocc)
-            CROSS_PLCC.append(plcc)
-
-            # Plot the correlation between ground-truth and predicted scores             
-            plot_correlation(yc, yc_pred, sc_y, len(SROCC_coef), srocc, dataset, cross_dataset)
-        
-        
-    return SROCC_coef, SROCC_p, PLCC, CROSS_SROCC, CROSS_PLCC
-
-def authentic_dataset_regression(X, y, Xc=None, yc=None, dataset='konvid1k', cross_dataset=None, regression_method='svr'):
+def authentic_dataset_regression(X, y, Xc=None, yc=None, dataset='konvid1k', cross_dataset=None, regression_method='svr',
+                                 n_jobs=4, plot=True):
     '''Train a regressor Using the features and their corresponding scores from
        an authentically distorted IQA/VQA dataset, predict the scores of test data. 
        Finally calculate the SROCC & PLCC.
     
     :param X: an array of video level features of all videos in the dataset
     :param y: an array scores of all videos in the dataset
-    :param regression_method: 'svr' for SVR or 'nn' for multi layer neural network
+    :param regression_method: 'svr' for SVR, 'nystroem' for linear SVR on approximated RBF kernel
+                              or 'nn' for multi layer neural network
+    :param n_jobs: number of train/test splits evaluated in parallel
+    :param plot: save the plots of the predicted and ground-truth scores of each split if True
     :return: SROCC_coef, SROCC_p, PLCC 
     '''
     # Turn y into a 2D array to match StandardScalar() input
     y = np.array(y).reshape(-1, 1)
     
-    SROCC_coef, SROCC_p, PLCC = [], [], []
-    # if cross dataset validation is required
-    if Xc is not None:
-        CROSS_SROCC, CROSS_PLCC = [], []
-        ycn = normalize_cross_scores(cross_dataset, yc)
-    else:
-        CROSS_SROCC, CROSS_PLCC = None, None
-  
-    # Repeat K-fold cross validation 10 times
-    for _ in range(20):
-        
-        # Use K-Fold Cross Validation for evaluation
-        kfold = KFold(n_splits=5, shuffle=True)
-        
-        for train_idx, test_idx in kfold.split(X):
-            # print(f'Test index = {test_idx}')
-            X_train, X_test = X[train_idx], X[test_idx]
-            y_train, y_test = y[train_idx], y[test_idx]
-            
-            # Feature Scaling
-            sc_X = StandardScaler()
-            sc_y = StandardScaler()
-            
-            X_train = sc_X.fit_transform(X_train)
-            X_test = sc_X.transform(X_test)
-            y_train = sc_y.fit_transform(y_train)
-            
-            if regression_method.lower() == 'svr':
-                # Set the regressor to SVR
-                regressor = SVR(kernel='rbf', epsilon=0.3)
-                # Train the SVR
-                regressor.fit(X_train, y_train.squeeze())
-            elif regression_method.lower() == 'nn':
-                # Set the regressor to neural network
-                tensorflow.keras.backend.clear_session()
-                regressor, history = nn_regressor(X_train, y_train.squeeze())
-                
-            # Predict the scores for X_test videos features
-            y_pred = regressor.predict(X_test)
-            
-            srocc, p, plcc = calc_correlation(y_test, y_pred, sc_y)
-          
-            SROCC_coef.append(srocc)
-            SROCC_p.append(p)
-            PLCC.append(plcc)
-            
-            pass
-            # Plot the correlation between ground-truth and predicted scores             
-            plot_correlation(y_test, y_pred, sc_y, len(SROCC_coef), srocc)
-            
-            # if cross dataset validation is required
-            if Xc is not None:
-                Xcs = sc_X.transform(Xc)
-                
-                yc_pred = regressor.predict(Xcs)
-                
-                srocc, _, plcc = calc_correlation(ycn, yc_pred, sc_y, dataset, '*')
-                
-                CROSS_SROCC.append(srocc)
-                CROSS_PLCC.append(plcc)
-            
-                # Plot the correlation between ground-truth and predicted scores             
-                plot_correlation(yc, yc_pred, sc_y, len(SROCC_coef), srocc, dataset, cross_dataset)
-            
-                                
-    return SROCC_coef, SROCC_p, PLCC, CROSS_SROCC, CROSS_PLCC
+    # Repeat K-fold cross validation 20 times, using K-Fold Cross Validation for evaluation
+    splits = (split for _ in range(20) for split in KFold(n_splits=5, shuffle=True).split(X))
+    
+    return cross_validate(X, y, splits, Xc, yc, dataset, cross_dataset, regression_method, n_jobs, plot)
     
         
-def regression(X, y, Xc=None, yc=None, regression_method='svr', dataset='koniq10k', cross_dataset=None):
+def regression(X, y, Xc=None, yc=None, regression_method='svr', dataset='koniq10k', cross_dataset=None,
+               n_jobs=4, plot=True):
     '''Get video features and scores and call the respective regressor according to the dataset name
     
     :param X: an array of video level features of all videos in the dataset
     :param y: an array scores of all videos in the dataset
     :param Xc: an array of video level features of all videos in the cross dataset
     :param yc: an array scores of all videos in the cross dataset
-    :param regression_method: 'svr' for SVR or 'nn' for multi layer neural network
+    :param regression_method: 'svr' for SVR, 'nystroem' for linear SVR on approximated RBF kernel
+                              or 'nn' for multi layer neural network
+    :param n_jobs: number of train/test splits evaluated in parallel
+    :param plot: save the plots of the predicted and ground-truth scores of each split if True
     '''
     
     dataset = dataset.lower()
@@ -344,12 +496,14 @@ def regression(X, y, Xc=None, yc=None, regression_method='svr', dataset='koniq10
                                                                                           synth_dist_per_ref[dataset],
                                                                                           Xc, yc, dataset,
                                                                                           cross_dataset,
-                                                                                          regression_method)
+                                                                                          regression_method,
+                                                                                          n_jobs, plot)
     else:
         SROCC_coef, SROCC_p, PLCC, CROSS_SROCC, CROSS_PLCC = authentic_dataset_regression(X, y, Xc, yc,
                                                                                           dataset, 
                                                                                           cross_dataset,
-                                                                                          regression_method)
+                                                                                          regression_method,
+                                                                                          n_jobs, plot)
     with open('correlation.txt', 'a') as writer:    
     # set the precision of the output for numpy arrays & suppress the use of scientific notation for small numbers
         with np.printoptions(precision=4, suppress=True):
@@ -378,4 +532,9 @@ def regression(X, y, Xc=None, yc=None, regression_method='svr', dataset='koniq10
             
             
             
-    
\ No newline at end of file
+    
+
+
+# Run the sanity check of the per-fold scalers if current file is the script, not a module
+if __name__ == "__main__":
+    check_fold_scaler()
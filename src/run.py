@@ -14,6 +14,9 @@
 # ---
 
 # + tags=[]
+import hashlib
+import os
+import tempfile
 import numpy as np
 import torch
 from torchvision import models
@@ -29,17 +32,78 @@ import SFVQA as sfv
 import VideoUtility as vu
 
 
+# Buffer size of reading and writing the cached features files (256 KiB)
+CACHE_BUFFER_SIZE = 1 << 18
+# Version of the cached features, to be bumped whenever the way the features are computed changes
+CACHE_VERSION = '2'
+
+
+# Fingerprints of the extractor models' weights, computed once for each model
+_weights_fingerprints = {}
+
+def weights_fingerprint(model) -> str:
+    '''Get a hash of the weights (and buffers) of a feature extractor model, so that the features of a
+       fine-tuned or retrained model are not mixed up with the ones of the pretrained model, which has
+       the same graph
+    
+    :param model: feature extractor model
+    :return: hex digest of the model state
+    '''
+    
+    if id(model) not in _weights_fingerprints:
+        sha = hashlib.sha1()
+        for name, tensor in model.state_dict().items():
+            sha.update(name.encode())
+            sha.update(tensor.detach().cpu().contiguous().numpy().tobytes())
+        _weights_fingerprints[id(model)] = sha.hexdigest()
+    
+    return _weights_fingerprints[id(model)]
+
+
 # + tags=[]
+def feats_cache_path(model, device, vid_path: str, transform, cache_dir: str, frame_diff: bool,
+                     stride: int = 1) -> Path:
+    '''Get the path of the cached frame features of a video, which is identified by the cache version,
+       the extractor model graph (model and its layers) and weights, its device and precision, the video decoder,
+       the preprocessing pipeline (frame size and center crop), the video file and its modification time
+    
+    :param model: feature extractor model
+    :param device: torch.device the features are extracted on
+    :param vid_path: path of the video
+    :param transform: preprocessing pipeline
+    :param cache_dir: directory of the cached features
+    :param frame_diff: indicate if the features are extracted from frame differences
+    :param stride: the frame sampling stride of the video
+    :return: path of the cache file
+    '''
+    
+    # The generated code of the extractor graph module includes the model layers and the return nodes
+    model_id = getattr(model, 'code', model.__class__.__name__)
+    # Features of the GPU run in half precision, and of different decoders, differ slightly
+    device_type = torch.device(device).type
+    precision = str(sfv.AMP_DTYPE) if device_type == 'cuda' else str(torch.float32)
+    decoder = 'skvideo' if vu.av is None else 'pyav'
+    key = '|'.join([CACHE_VERSION, model_id, weights_fingerprint(model), device_type, precision, decoder, repr(transform), vid_path,
+                    str(Path(vid_path).stat().st_mtime), str(frame_diff), str(stride)])
+    
+    return Path(cache_dir) / f'{hashlib.sha1(key.encode()).hexdigest()}.npy'
+
+
 def videoset_frame_feats(model, device, video_list: str, video_path: str, transform, 
-                         dataset: str = 'LIVE', *, frame_diff=False) -> list:
+                         dataset: str = 'LIVE', *, frame_diff=False, stride: int = 1,
+                         cache_dir: str = 'cache', cache_regenerate: bool = False) -> list:
     '''Get the VQA dataset video names and scores, set a feature extractor model,
-       get frames of each video, then get features of each frame in videos
+       get frames of each video, then get features of each frame in videos.
+       Frame features of each video are cached on disk on the first run and reloaded thereafter
        
     :param video_list: list of video sequences name
     :param video_path: videos' directory
     :param transform: preprocessing pipeline
     :param dataset: name of the VQA dataset to extract the features from
     :param fine_tune: use fine-tuned model if True
+    :param stride: keep only every stride-th frame of each video
+    :param cache_dir: directory of the cached frame features, caching is disabled if None
+    :param cache_regenerate: extract the features again and overwrite the cached ones if True
     :return: videos' frames features of dimension and videos scores (DMOS)
     '''
     
@@ -47,18 +111,46 @@ def videoset_frame_feats(model, device, video_list: str, video_path: str, transf
     # Convert the path string to a pathlib object
     video_path = Path(video_path)
     dataset = dataset.lower()
+    if cache_dir is not None:
+        Path(cache_dir).mkdir(parents=True, exist_ok=True)
     # videos_frame_features = []
     for seq in tqdm(video_list):
         # Concatenate the video sequence name to the video directory to get the full video path
         vid_path = str(video_path / seq)
+        
+        # Load the features of the video if they have already been cached
+        if cache_dir is not None:
+            cache_path = feats_cache_path(model, device, vid_path, transform, cache_dir, frame_diff, stride)
+            if cache_path.exists() and not cache_regenerate:
+                with open(cache_path, 'rb', buffering=CACHE_BUFFER_SIZE) as f:
+                    frames_features = np.load(f)
+                yield frames_features
+                continue
+        
         if dataset == 'live':
             # Get frames of the video of the dimension 768 * 432 (LIVE VQA videos)
-            vid_frames = vu.get_frames(vid_path, height=432, width=768)
+            vid_frames = vu.get_frames(vid_path, height=432, width=768, stride=stride)
         else:
-            vid_frames = vu.get_frames(vid_path, frame_diff=frame_diff)
-        # Get the features of all frames of the video
-        frames_features = sfv.get_video_style_features(vid_frames, model, device, transform)
-        frames_features = np.array(frames_features)
+            vid_frames = vu.get_frames(vid_path, frame_diff=frame_diff, stride=stride)
+        # Decode the frames in the background while the model extracts the features
+        vid_frames = vu.prefetch_frames(vid_frames)
+        # Get the features of all frames of the video, and stop the decoder thread even if it fails
+        try:
+            frames_features = sfv.get_video_style_features(vid_frames, model, device, transform)
+        finally:
+            vid_frames.close()
+        
+        if cache_dir is not None:
+            # Write to a temporary file first, so that an interrupted run doesn't leave a truncated
+            # cache file behind, then move it to the cache path atomically
+            fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=cache_dir)
+            try:
+                with os.fdopen(fd, 'wb', buffering=CACHE_BUFFER_SIZE) as f:
+                    np.save(f, frames_features)
+                os.replace(tmp_path, cache_path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
         # videos_frame_features.append(frames_features)
         yield frames_features
     
@@ -68,7 +160,8 @@ def videoset_frame_feats(model, device, video_list: str, video_path: str, transf
 # -
 
 def video_level_feats(ffeats_extractor, dfeats_extractor, device, dataset, frame_size, center_crop,
-                      frame_diff: bool = False, pool_type='max'):
+                      frame_diff: bool = False, pool_type='max', stride=1, cache_dir='cache',
+                      cache_regenerate=False):
     '''Get frame level features and pool them to have video level features (representation)
     
     :param model: feature extractor model object
@@ -80,6 +173,9 @@ def video_level_feats(ffeats_extractor, dfeats_extractor, device, dataset, frame
     :param center_crop: the size to crop a center patch from the resized frame
     :param frame_diff: indicate if features of frame differences are required
     :param pool_type: for simple pooling, the method of pooling frame level feats of a video
+    :param stride: keep only every stride-th frame of each video
+    :param cache_dir: directory of the cached frame features, caching is disabled if None
+    :param cache_regenerate: extract the frame features again and overwrite the cached ones if True
     :return: pooled frame features of videos, video quality scores 
     
     '''
@@ -90,13 +186,16 @@ def video_level_feats(ffeats_extractor, dfeats_extractor, device, dataset, frame
                                                                      center_crop=center_crop)
     # Get frame features of all videos in the dataset --------------------------------------*
     videos_features = videoset_frame_feats(ffeats_extractor, device, video_list, video_path, 
-                                           transform, dataset)
+                                           transform, dataset, stride=stride, cache_dir=cache_dir,
+                                           cache_regenerate=cache_regenerate)
     # Pool the frame level features to get video level features
     pooled_features = pooling.simple_pooling(videos_features, pool_type=pool_type)
     
     if frame_diff:
         diff_features = videoset_frame_feats(dfeats_extractor, device, video_list, video_path, transform,
-                                             dataset, frame_diff=frame_diff)
+                                             dataset, frame_diff=frame_diff, stride=stride,
+                                             cache_dir=cache_dir,
+                                             cache_regenerate=cache_regenerate)
         # Pool the frame level features to get video level features
         pooled_diff = pooling.simple_pooling(diff_features, pool_type=pool_type)
         
@@ -160,6 +259,8 @@ def init_vqa(model_name, vqa_dataset, cross_dataset=None, frame_diff=False):
     
     # Check if there is a GPU
     device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    # Frame size is fixed, so let cuDNN pick the fastest convolution algorithms once
+    torch.backends.cudnn.benchmark = True
     # Set the frame features extractor model
     ffeats_extractor, dfeats_extractor = sfv.set_feats_extractor(device, model_name, layers, diff_layer,
                                                                  fine_tune=False, frame_size=frame_size,